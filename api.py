@@ -1,53 +1,126 @@
 import os
-import shutil
+import queue
+import uuid
 import logging
-from fastapi import FastAPI, File, UploadFile, HTTPException, Form
-from fastapi.responses import JSONResponse, HTMLResponse
+from contextlib import asynccontextmanager
+import aiofiles
+import anyio
+from fastapi import FastAPI, File, UploadFile, HTTPException, Form, BackgroundTasks, Request
+from fastapi.responses import JSONResponse
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.staticfiles import StaticFiles
-from llm_service import get_total_cost, reset_cost
+from llm_service import get_total_cost, reset_cost, reset_cache
 
 from pathlib import Path
+from pydantic import BaseModel
+from typing import Tuple
 import uvicorn
 from fastapi.concurrency import run_in_threadpool # Import run_in_threadpool
 
 # Assuming main.py can be refactored or its core logic imported
 # For now, let's simulate the processing logic
-from document_processor import read_pdf, read_text
-from llm_service import get_llm_client, extract_structured_data
+from document_processor import read_and_clean_pdf, read_text, MAX_CHAR_LIMIT
+from llm_service import get_async_llm_client, extract_structured_data_async, get_max_document_chars, truncate_to_token_limit, InsuranceData
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-app = FastAPI(title="Insurance Document Parser API")
+# Size of the thread pool used for blocking work such as PDF parsing
+THREADPOOL_SIZE = int(os.getenv("THREADPOOL_SIZE", 64))
 
-# Serve static files (for frontend UI)
-app.mount("/static", StaticFiles(directory="static"), name="static")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    anyio.to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
+    yield
 
-@app.get("/", response_class=HTMLResponse)
-async def serve_frontend():
-    with open("static/index.html", "r", encoding="utf-8") as f:
-        return f.read()
+app = FastAPI(title="Insurance Document Parser API", lifespan=lifespan)
 
-
-# Add a simple root endpoint
-@app.get("/", summary="Root endpoint", include_in_schema=False)
-async def read_root():
-    return {"message": "Insurance Document Parser API is running. Visit /docs for documentation."}
+# Compress responses larger than 1 KB (disable compression at any proxy in front to avoid doing it twice)
+app.add_middleware(GZipMiddleware, minimum_size=1024)
 
 # Define directories relative to the script location
 BASE_DIR = Path(__file__).resolve().parent
+STATIC_DIR = BASE_DIR / "static"
 UPLOAD_DIR = BASE_DIR / "api_uploads"
 OUTPUT_DIR = BASE_DIR / "api_output"
 
+UPLOAD_CHUNK_SIZE = 1 << 20  # 1 MiB
+# Uploads up to this size are parsed from memory without touching the disk
+MAX_IN_MEMORY_UPLOAD_BYTES = int(os.getenv("MAX_IN_MEMORY_UPLOAD_MB", 200)) * 1024 * 1024
+
+# Reusable upload buffers, sized for typical policy documents, to avoid a fresh allocation per upload
+UPLOAD_BUFFER_SIZE = 4 * 1024 * 1024  # 4 MiB
+UPLOAD_BUFFER_POOL_SIZE = 16
+_upload_buffers: "queue.LifoQueue[bytearray]" = queue.LifoQueue(maxsize=UPLOAD_BUFFER_POOL_SIZE)
+
+def _borrow_buffer() -> bytearray:
+    """Takes a buffer from the pool, allocating a new one if the pool is empty."""
+    try:
+        return _upload_buffers.get_nowait()
+    except queue.Empty:
+        return bytearray(UPLOAD_BUFFER_SIZE)
+
+def _return_buffer(buffer: bytearray):
+    """Puts a buffer back into the pool; buffers grown for large uploads are released instead."""
+    if len(buffer) != UPLOAD_BUFFER_SIZE:
+        return
+    try:
+        _upload_buffers.put_nowait(buffer)
+    except queue.Full:
+        pass
+
+def _readinto(fileobj, view: memoryview) -> int:
+    """Reads from fileobj directly into view and returns the number of bytes read."""
+    if hasattr(fileobj, "readinto"):
+        return fileobj.readinto(view)
+    # SpooledTemporaryFile only implements readinto from Python 3.11
+    chunk = fileobj.read(len(view))
+    view[:len(chunk)] = chunk
+    return len(chunk)
+
+def _read_into_buffer(fileobj, buffer: bytearray, limit: int) -> Tuple[bytearray, int]:
+    """Reads fileobj into buffer, growing it as needed, until EOF or more than limit bytes are read.
+
+    Returns the (possibly replaced) buffer and the number of bytes read.
+    """
+    size = 0
+    while True:
+        if size == len(buffer):
+            if size > limit:
+                break
+            buffer = buffer + bytearray(min(len(buffer), limit + 1 - size))
+        with memoryview(buffer) as view, view[size:] as free:
+            n = _readinto(fileobj, free)
+        if not n:
+            break
+        size += n
+    return buffer, size
+
 # Ensure directories exist
 UPLOAD_DIR.mkdir(exist_ok=True)
 OUTPUT_DIR.mkdir(exist_ok=True)
 
-@app.post("/upload/", summary="Upload and process an insurance document")
-async def upload_document(file: UploadFile = File(...), llm_provider: str = Form("openai"), model: str = Form("gpt-3.5-turbo")):
+async def _save_json(output_filename: Path, content: str):
+    """Writes the extracted JSON to disk; runs as a background task after the response is sent."""
+    try:
+        async with aiofiles.open(output_filename, "w", encoding="utf-8") as f:
+            await f.write(content)
+        logging.info(f"Successfully saved extracted data to {output_filename}")
+    except Exception as e:
+        logging.error(f"Error saving JSON to {output_filename}: {e}", exc_info=True)
+
+class UploadResponse(BaseModel):
+    extracted_data: InsuranceData
+    cost: float
+
+# The typed response model is serialized by pydantic-core; field names (not aliases) are returned
+@app.post("/upload/", summary="Upload and process an insurance document", response_model=UploadResponse, response_model_by_alias=False)
+async def upload_document(background_tasks: BackgroundTasks, file: UploadFile = File(...), llm_provider: str = Form("openai"), model: str = Form("gpt-3.5-turbo"), save: bool = True, use_cache: bool = True):
     """
     Uploads a single insurance document (PDF or TXT), processes it using the LLM,
     and returns the extracted structured data.
+    The JSON output is saved to api_output unless the `save=false` query parameter is given,
+    and a cached result for an identical document is reused unless `use_cache=false` is given.
     """
     if not file.filename:
         raise HTTPException(status_code=400, detail="No file uploaded.")
@@ -56,62 +129,71 @@ async def upload_document(file: UploadFile = File(...), llm_provider: str = Form
     if file_extension not in [".pdf", ".txt"]:
         raise HTTPException(status_code=400, detail="Invalid file type. Only PDF and TXT are supported.")
 
-    # Save the uploaded file temporarily
-    temp_file_path = UPLOAD_DIR / file.filename
+    # Only used if the upload is too large to parse from memory; the unique name keeps
+    # concurrent uploads with the same filename from touching each other's files
+    temp_file_path = UPLOAD_DIR / f"{uuid.uuid4().hex}{file_extension}"
+    spilled = False
+    upload_buffer = _borrow_buffer()
     try:
-        with temp_file_path.open("wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        # Parse straight from the upload buffer; spill to disk only above the size cap
+        upload_buffer, size = await run_in_threadpool(_read_into_buffer, file.file, upload_buffer, MAX_IN_MEMORY_UPLOAD_BYTES)
+        if size > MAX_IN_MEMORY_UPLOAD_BYTES:
+            logging.info(f"File '{file.filename}' exceeds the in-memory limit, saving to {temp_file_path}")
+            spilled = True
+            # Copy in chunks asynchronously so the event loop keeps serving other requests
+            async with aiofiles.open(temp_file_path, "wb") as buffer:
+                with memoryview(upload_buffer) as view, view[:size] as head:
+                    await buffer.write(head)
+                while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                    await buffer.write(chunk)
         logging.info(f"File '{file.filename}' uploaded successfully.")
 
         # --- Processing Logic (adapted from main.py) ---
-        logging.info(f"Processing document: {temp_file_path}")
-        # Run blocking I/O in thread pool
-        text_content = await run_in_threadpool(read_pdf, temp_file_path)
+        logging.info(f"Processing document: {file.filename}")
+        # Reading stops at a character bound derived from the model's token budget, so the
+        # token cut below is what actually limits the document
+        max_chars = await run_in_threadpool(get_max_document_chars, model, MAX_CHAR_LIMIT)
+        # Run blocking I/O in thread pool; text is cleaned and truncated to max_chars while reading
+        if spilled:
+            text_content = await run_in_threadpool(read_and_clean_pdf, temp_file_path, max_chars=max_chars, filetype=file_extension.lstrip("."))
+        else:
+            # The view is released before the buffer goes back to the pool
+            with memoryview(upload_buffer) as view, view[:size] as data:
+                text_content = await run_in_threadpool(read_and_clean_pdf, data, max_chars=max_chars, filetype=file_extension.lstrip("."))
 
         if not text_content:
-            logging.warning(f"Could not extract text from {temp_file_path}")
+            logging.warning(f"Could not extract text from {file.filename}")
             raise HTTPException(status_code=400, detail=f"Could not extract text from file: {file.filename}")
-        # --- Truncate very large documents if LLM has tokens limit ---
-        MAX_CHAR_LIMIT = 20000
-        if len(text_content) > MAX_CHAR_LIMIT:
-            logging.warning(f"Document too large ({len(text_content)} characters). Truncating to {MAX_CHAR_LIMIT} characters.")
-            text_content = text_content[:MAX_CHAR_LIMIT]
 
+        # Cut to the model's real token budget
+        text_content = await run_in_threadpool(truncate_to_token_limit, text_content, model, MAX_CHAR_LIMIT)
 
-        llm_service = get_llm_client(llm_provider=llm_provider)
+        llm_service = get_async_llm_client(llm_provider=llm_provider)
         if not llm_service:
              raise HTTPException(status_code=500, detail=f"Failed to initialize LLM service: {llm_provider}")
 
-        # Run blocking LLM call in thread pool
-        # TODO: Integrate cost tracking here when llm_service is updated
-        logging.info(f"Calling LLM service ({llm_provider} - {model}) for {temp_file_path.name}") # Added logging
+        # The LLM call is network I/O, so it is awaited on the event loop instead of using the thread pool
+        logging.info(f"Calling LLM service ({llm_provider} - {model}) for {file.filename}") # Added logging
         try:
-            structured_data = await run_in_threadpool(extract_structured_data, text_content, llm_provider=llm_provider, model=model)
-            logging.info(f"LLM call successful for {temp_file_path.name}") # Added logging
+            structured_data = await extract_structured_data_async(text_content, llm_provider=llm_provider, model=model, use_cache=use_cache)
+            logging.info(f"LLM call successful for {file.filename}") # Added logging
         except Exception as llm_exc:
-            logging.error(f"Error during LLM call for {temp_file_path.name}: {llm_exc}", exc_info=True) # Added detailed logging
+            logging.error(f"Error during LLM call for {file.filename}: {llm_exc}", exc_info=True) # Added detailed logging
             raise HTTPException(status_code=500, detail=f"Error during LLM processing for {file.filename}")
 
         if structured_data:
-            output_filename = OUTPUT_DIR / f"{temp_file_path.stem}.json"
-            logging.info(f"Attempting to save structured data to {output_filename}") # Added logging
-            try:
-                with open(output_filename, 'w', encoding='utf-8') as f:
-                    f.write(structured_data.model_dump_json(indent=4))
-                logging.info(f"Successfully extracted data for {temp_file_path.name} to {output_filename}")
-
-                # Return the extracted data directly
-                # return structured_data.model_dump()
-                return {
-                    "extracted_data": structured_data.model_dump(),
-                    "cost": round(get_total_cost(), 6)  # return the cost rounded
-                }
-
-            except Exception as e:
-                logging.error(f"Error saving JSON for {temp_file_path.name}: {e}", exc_info=True) # Added detailed logging
-                raise HTTPException(status_code=500, detail=f"Error saving extracted data for {file.filename}")
+            if save:
+                output_filename = OUTPUT_DIR / f"{Path(file.filename).stem}.json"
+                # Written after the response is sent so the client doesn't wait on disk I/O
+                background_tasks.add_task(_save_json, output_filename, structured_data.model_dump_json(indent=4))
+                logging.info(f"Scheduled saving structured data for {file.filename} to {output_filename}")
+
+            return UploadResponse(
+                extracted_data=structured_data,
+                cost=round(get_total_cost(), 6)  # return the cost rounded
+            )
         else:
-            logging.error(f"Failed to extract structured data for {temp_file_path.name} (LLM returned None)") # Clarified logging
+            logging.error(f"Failed to extract structured data for {file.filename} (LLM returned None)") # Clarified logging
             raise HTTPException(status_code=500, detail=f"LLM failed to extract data from {file.filename}")
 
     except HTTPException as http_exc:
@@ -121,20 +203,50 @@ async def upload_document(file: UploadFile = File(...), llm_provider: str = Form
         logging.error(f"An error occurred during processing {file.filename}: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"An internal error occurred processing {file.filename}.")
     finally:
-        # Clean up the uploaded file
-        if temp_file_path.exists():
+        # Clean up the temporary file, if this request wrote one
+        if spilled and temp_file_path.exists():
             try:
                 os.remove(temp_file_path)
                 logging.info(f"Removed temporary file: {temp_file_path}")
             except OSError as e:
                 logging.error(f"Error removing temporary file {temp_file_path}: {e}")
+        _return_buffer(upload_buffer)
         # Ensure the file object is closed
         await file.close()
 
 
+@app.post("/cache/reset/", summary="Clear the response cache")
+async def clear_cache():
+    """
+    Removes all cached extraction results so subsequent uploads call the LLM again.
+    """
+    await run_in_threadpool(reset_cache)
+    logging.info("Response cache cleared.")
+    return {"message": "Cache cleared."}
+
+
+# Serve static files (for frontend UI) with ETag/Last-Modified handling
+_static_files = StaticFiles(directory=STATIC_DIR)
+app.mount("/static", _static_files, name="static")
+
+# An explicit route rather than a catch-all mount at "/", which would swallow unmatched API
+# paths and break the trailing-slash redirect (POST /upload would get a 405 instead of a 307)
+@app.get("/", include_in_schema=False)
+async def serve_frontend(request: Request):
+    return await _static_files.get_response("index.html", request.scope)
+
 
 if __name__ == "__main__":
-    # Make sure to run with uvicorn for development
-    # Example: uvicorn api:app --reload
-    print("To run the API, use the command: uvicorn api:app --reload")
-    # uvicorn.run(app, host="127.0.0.1", port=8000)
\ No newline at end of file
+    # Production-style run: uvloop event loop where available (loop="auto" falls back to asyncio
+    # on Windows, which uvloop does not support), httptools HTTP parser and multiple workers.
+    # Equivalent CLI: uvicorn api:app --loop auto --http httptools --workers 4
+    # With gunicorn: gunicorn api:app -w 4 -k uvicorn.workers.UvicornWorker
+    # For development with auto-reload use: uvicorn api:app --reload
+    uvicorn.run(
+        "api:app",
+        host=os.getenv("HOST", "0.0.0.0"),
+        port=int(os.getenv("PORT", 8000)),
+        loop="auto",
+        http="httptools",
+        workers=int(os.getenv("WEB_CONCURRENCY", 4)),
+    )
@@ -1,19 +1,60 @@
 import fitz  # PyMuPDF
-import re
+from typing import Callable, Iterator, Optional, Union
 
-def read_pdf(file_path: str) -> str:
-    """Reads text content from a PDF file."""
+# Truncate very large documents if LLM has tokens limit
+MAX_CHAR_LIMIT = 20000
+
+def _open_document(data_or_path: Union[str, bytes, bytearray, memoryview], filetype: str = "pdf") -> fitz.Document:
+    """Opens a document from a file path or from raw bytes held in memory."""
+    if isinstance(data_or_path, (bytes, bytearray, memoryview)):
+        return fitz.open(stream=data_or_path, filetype=filetype)
+    return fitz.open(data_or_path)
+
+def _read_document(
+    data_or_path: Union[str, bytes, bytearray, memoryview],
+    filetype: str,
+    collect: Callable[[Iterator[str]], str],
+) -> str:
+    """Opens a document and lets collect consume its page texts; returns "" if it can't be read."""
     try:
-        doc = fitz.open(file_path)
-        text = ""
-        for page in doc:
-            text += page.get_text()
-        doc.close()
-        return text
+        with _open_document(data_or_path, filetype) as doc:
+            return collect(page.get_text("text") for page in doc)
     except Exception as e:
-        print(f"Error reading PDF {file_path}: {e}")
+        source = "<in-memory upload>" if isinstance(data_or_path, (bytes, bytearray, memoryview)) else data_or_path
+        print(f"Error reading PDF {source}: {e}")
         return ""
 
+def _clean_and_truncate(pages: Iterator[str], max_chars: Optional[int]) -> str:
+    """Cleans each page as it arrives and stops consuming pages once max_chars is reached."""
+    parts = []
+    total_len = 0
+    for page_text in pages:
+        cleaned_page = clean_text(page_text)
+        if not cleaned_page:
+            continue
+        parts.append(cleaned_page)
+        total_len += len(cleaned_page) + 1  # Plus the joining space
+        if max_chars is not None and total_len >= max_chars:
+            break
+    text = ' '.join(parts)
+    return text[:max_chars].strip() if max_chars is not None else text
+
+def read_pdf(data_or_path: Union[str, bytes, bytearray, memoryview], filetype: str = "pdf") -> str:
+    """Reads the full, uncleaned text content from a PDF file path or from raw PDF bytes held in memory."""
+    return _read_document(data_or_path, filetype, "".join)
+
+def read_and_clean_pdf(
+    data_or_path: Union[str, bytes, bytearray, memoryview],
+    max_chars: Optional[int] = MAX_CHAR_LIMIT,
+    filetype: str = "pdf",
+) -> str:
+    """Reads, cleans and truncates PDF text in a single pass over the pages.
+
+    Each page is cleaned as soon as it is read and reading stops once max_chars is reached,
+    so the raw text of the whole document is never held in memory.
+    """
+    return _read_document(data_or_path, filetype, lambda pages: _clean_and_truncate(pages, max_chars))
+
 def read_text(file_path: str) -> str:
     """Reads text content from a plain text file."""
     try:
@@ -25,22 +66,20 @@ def read_text(file_path: str) -> str:
 
 def clean_text(text: str) -> str:
     """Performs basic text cleaning."""
-    # Remove excessive whitespace
-    text = re.sub(r'\s+', ' ', text).strip()
+    # Collapse runs of whitespace; str.split() matches re.sub(r'\s+', ' ', text).strip() but runs in C
+    text = ' '.join(text.split())
     # Add more cleaning steps if needed (e.g., removing headers/footers, special characters)
     return text
 
-def process_document(file_path: str) -> str:
-    """Reads and cleans text from a supported document file."""
-    text = ""
+def process_document(file_path: str, max_chars: Optional[int] = MAX_CHAR_LIMIT) -> str:
+    """Reads and cleans text from a supported document file, truncated to max_chars."""
     if file_path.lower().endswith('.pdf'):
-        text = read_pdf(file_path)
+        # Reading, cleaning and truncation happen page by page in one pass
+        return read_and_clean_pdf(file_path, max_chars=max_chars)
     elif file_path.lower().endswith('.txt'):
-        text = read_text(file_path)
+        # A text file is treated as a single page, so it is cut the same way as a PDF
+        return _clean_and_truncate(iter([read_text(file_path)]), max_chars)
     # Add support for other formats like JSON if needed
     else:
         print(f"Unsupported file format: {file_path}")
         return ""
-
-    cleaned_text = clean_text(text)
-    return cleaned_text
\ No newline at end of file
@@ -1,10 +1,20 @@
 import os
 import json
-from typing import List, Optional
+import asyncio
+import functools
+import hashlib
+import re
+import sqlite3
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
 from pydantic import BaseModel, Field, ValidationError
-from openai import OpenAI
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, DefaultHttpxClient, OpenAI
+import httpx
+import tiktoken
 from dotenv import load_dotenv
 import time
+import threading
 import logging
 
 # Configure logging (use the same configuration as main.py/api.py if possible)
@@ -18,30 +28,47 @@ MODEL_COSTS = {
     "gpt-3.5-turbo": {"input": 0.0005, "output": 0.0015},
     "gpt-4": {"input": 0.03, "output": 0.06},
     "gpt-4-turbo": {"input": 0.01, "output": 0.03},
-    "gpt-4o-2024-08-06": {"input": 0.01, "output": 0.03},
+    # Prompt tokens served from OpenAI's prompt cache are billed at half the input price
+    "gpt-4o-2024-08-06": {"input": 0.01, "cached_input": 0.005, "output": 0.03},
     # Add other models as needed
 }
 
+# Guards _total_cost, which is updated from threadpool workers and concurrent CLI tasks.
+# Each uvicorn worker process still keeps its own total.
 _total_cost = 0.0
+_cost_lock = threading.Lock()
 
 def get_total_cost():
     """Returns the total accumulated cost since the last reset."""
-    global _total_cost
-    return _total_cost
+    with _cost_lock:
+        return _total_cost
 
 def reset_cost():
     """Resets the total accumulated cost to zero."""
     global _total_cost
-    _total_cost = 0.0
+    with _cost_lock:
+        _total_cost = 0.0
+
+def _add_cost(call_cost: float) -> float:
+    """Adds the cost of one API call to the total and returns the new total."""
+    global _total_cost
+    with _cost_lock:
+        _total_cost += call_cost
+        return _total_cost
 
-def _calculate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
-    """Calculates the cost for a given API call."""
+def _calculate_cost(model: str, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0) -> float:
+    """Calculates the cost for a given API call.
+
+    cached_tokens is the part of prompt_tokens served from the prompt cache; models without a
+    "cached_input" price bill it at the normal input price.
+    """
     cost_info = MODEL_COSTS.get(model)
     if not cost_info:
         logging.warning(f"Cost information not found for model: {model}. Cost will not be calculated.")
         return 0.0
     
-    input_cost = (prompt_tokens / 1000) * cost_info["input"]
+    cached_price = cost_info.get("cached_input", cost_info["input"])
+    input_cost = ((prompt_tokens - cached_tokens) / 1000) * cost_info["input"] + (cached_tokens / 1000) * cached_price
     output_cost = (completion_tokens / 1000) * cost_info["output"]
     return input_cost + output_cost
 
@@ -57,14 +84,224 @@ class InsuranceData(BaseModel):
     coverage_types: Optional[List[str]] = Field(None, alias="Coverage Types")
     risk_factors: Optional[List[str]] = Field(None, alias="Risk Factors")
 
+# --- Prompt ---
+# Kept free of per-document interpolation so it forms a stable prefix for
+# OpenAI's automatic prompt caching (applies to prompts of 1024+ tokens).
+SYSTEM_PROMPT = "You are an expert assistant specialized in extracting structured data from insurance documents into JSON format."
+
+EXTRACTION_INSTRUCTIONS = """Extract the following information from the insurance document provided by the user:
+1. Policyholder Name
+2. Policy Number
+3. Start Date
+4. End Date
+5. Coverage Types (list of strings)
+6. Risk Factors (list of strings)
+
+Return the information ONLY in JSON format with the exact keys specified above (e.g., "Policyholder Name"). If a field is not found, omit it or set its value to null.
+"""
+
+# Models with automatic prompt caching. Only these get the schema appended to the instructions:
+# it restates the keys above, so it lengthens the cacheable prefix without changing the task,
+# but on other models it would just be billed at the full input price on every call.
+PROMPT_CACHING_MODELS = {"gpt-4o-2024-08-06"}
+
+SCHEMA_INSTRUCTIONS = """
+The output must conform to this JSON schema:
+""" + json.dumps(InsuranceData.model_json_schema(by_alias=True), indent=2) + "\n"
+
+def get_extraction_instructions(model: str) -> str:
+    """Returns the extraction instructions for a model, with the schema for prompt-caching models."""
+    if model in PROMPT_CACHING_MODELS:
+        return EXTRACTION_INSTRUCTIONS + SCHEMA_INSTRUCTIONS
+    return EXTRACTION_INSTRUCTIONS
+
+# Matches the outermost JSON object in a response, ignoring any surrounding text or code fences
+_JSON_OBJECT_RE = re.compile(r'\{.*\}', re.DOTALL)
+
+# --- Token Budget ---
+# Context window sizes in tokens
+MODEL_CONTEXT_WINDOWS = {
+    "gpt-3.5-turbo": 16385,
+    "gpt-4": 8192,
+    "gpt-4-turbo": 128000,
+    "gpt-4o-2024-08-06": 128000,
+    # Add other models as needed
+}
+DEFAULT_CONTEXT_WINDOW = 8192
+MAX_DOCUMENT_TOKENS = 12000
+# Room left for the JSON answer
+COMPLETION_HEADROOM_TOKENS = 1024
+
+@functools.lru_cache(maxsize=8)
+def _get_encoding(model: str) -> Optional[tiktoken.Encoding]:
+    """Returns the tokenizer for a model, falling back to cl100k_base for unknown models.
+
+    tiktoken downloads the encoding on first use; if that fails None is returned (and cached,
+    so later calls don't retry the download until restart).
+    """
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logging.warning(f"Could not load tiktoken encoding for {model} (set TIKTOKEN_CACHE_DIR for offline use): {e}")
+        return None
+
+@functools.lru_cache(maxsize=8)
+def get_max_document_tokens(model: str) -> int:
+    """Returns how many document tokens fit in the model's context next to the prompt and the answer."""
+    enc = _get_encoding(model)
+    prompt_overhead = len(enc.encode(SYSTEM_PROMPT)) + len(enc.encode(get_extraction_instructions(model))) + 32
+    context_window = MODEL_CONTEXT_WINDOWS.get(model, DEFAULT_CONTEXT_WINDOW)
+    return min(MAX_DOCUMENT_TOKENS, context_window - prompt_overhead - COMPLETION_HEADROOM_TOKENS)
+
+# Generous characters-per-token ratio (English text averages about 4), so a character cut at
+# this many characters per token stays above the token budget and tiktoken makes the real cut
+MAX_CHARS_PER_TOKEN = 6
+
+def get_max_document_chars(model: str, fallback_max_chars: int) -> int:
+    """Returns how many characters to read from a document before truncate_to_token_limit.
+
+    Falls back to fallback_max_chars when the tokenizer is unavailable, matching the cut
+    truncate_to_token_limit makes in that case. Blocking, like truncate_to_token_limit.
+    """
+    if _get_encoding(model) is None:
+        return fallback_max_chars
+    return get_max_document_tokens(model) * MAX_CHARS_PER_TOKEN
+
+def truncate_to_token_limit(text: str, model: str, fallback_max_chars: int) -> str:
+    """Truncates text to the number of tokens the model can take for the document.
+
+    If the tokenizer is unavailable, the text is cut to fallback_max_chars characters instead.
+    Blocking (the tokenizer may be downloaded on first use), so call it from a worker thread.
+    """
+    enc = _get_encoding(model)
+    if enc is None:
+        return text[:fallback_max_chars]
+    max_tokens = get_max_document_tokens(model)
+    tokens = enc.encode(text)
+    if len(tokens) <= max_tokens:
+        return text
+    logging.warning(f"Document too large ({len(tokens)} tokens). Truncating to {max_tokens} tokens for {model}.")
+    return enc.decode(tokens[:max_tokens])
+
+# --- Response Cache ---
+CACHE_PATH = Path(__file__).resolve().parent / "api_output" / "cache.sqlite"
+CACHE_TTL_SECONDS = 7 * 24 * 60 * 60  # 7 days
+
+@functools.lru_cache(maxsize=8)
+def _prompt_fingerprint(model: str) -> str:
+    """Hashes the prompt and the output schema, so editing either invalidates cached results."""
+    schema = json.dumps(InsuranceData.model_json_schema(by_alias=True), sort_keys=True)
+    prompt = f"{SYSTEM_PROMPT}\0{get_extraction_instructions(model)}\0{schema}"
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+def _cache_key(document_text: str, model: str) -> str:
+    """Hashes the whitespace-normalized document text together with the model and prompt."""
+    normalized = ' '.join(document_text.split())
+    return hashlib.sha256(f"{model}\0{_prompt_fingerprint(model)}\0{normalized}".encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    """Caches extraction results keyed by a hash of the exact document text.
+
+    Only identical documents (e.g. re-uploads) share an entry. Similarity matching is not
+    safe here: policies on the same insurer template differ precisely in the extracted
+    fields, so a near-duplicate would return another customer's data.
+    """
+
+    def __init__(self, path: Path = CACHE_PATH, ttl: int = CACHE_TTL_SECONDS):
+        self.path = Path(path)
+        self.ttl = ttl
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, data TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # A fresh connection per operation keeps the cache safe to use from the threadpool
+        conn = sqlite3.connect(self.path)
+        try:
+            with conn:  # Commits on success, rolls back on error
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, key: str) -> Optional[str]:
+        """Returns the cached JSON for a key, if present and not expired."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT data FROM responses WHERE key = ? AND created_at >= ?",
+                (key, time.time() - self.ttl),
+            ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, data: str) -> None:
+        """Stores the JSON result for a key and evicts expired entries."""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl,))
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, data, created_at) VALUES (?, ?, ?)",
+                (key, data, now),
+            )
+
+    def clear(self) -> None:
+        """Removes every cached entry."""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM responses")
+
+_cache: Optional[ResponseCache] = None
+
+def get_cache() -> ResponseCache:
+    """Returns the shared response cache, creating it on first use."""
+    global _cache
+    if _cache is None:
+        _cache = ResponseCache()
+    return _cache
+
+def reset_cache():
+    """Clears all entries from the response cache."""
+    get_cache().clear()
+
+def _lookup_cache(document_text: str, model: str) -> Tuple[Optional[str], Optional[InsuranceData]]:
+    """Returns the cache key for a document and the cached result, if there is one."""
+    key = _cache_key(document_text, model)
+    try:
+        cached = get_cache().get(key)
+        if cached:
+            logging.info("Response cache hit.")
+            return key, InsuranceData.model_validate_json(cached)
+    except Exception as e:
+        logging.warning(f"Response cache lookup failed, calling the LLM: {e}")
+    return key, None
+
 # --- LLM Interaction Logic ---
+# Transient API errors (rate limits, timeouts, 5xx) are retried inside the OpenAI client
+# with exponential backoff and jitter, so no manual sleep/retry loop is needed here.
+LLM_MAX_RETRIES = 2
+LLM_TIMEOUT = 30  # seconds
+# The OpenAI SDK's own connection limits (well above the API's 64 worker threads and the CLI's
+# concurrency), but idle connections are kept for 30s instead of 5s so they survive the gaps
+# between uploads and skip a new TLS handshake
+LLM_CONNECTION_LIMITS = httpx.Limits(max_connections=1000, max_keepalive_connections=100, keepalive_expiry=30)
+
+@functools.lru_cache(maxsize=4)
 def get_llm_client(llm_provider: str = "openai"):
-    """Initializes and returns the appropriate LLM client."""
+    """Initializes and returns the appropriate LLM client.
+
+    Clients are cached per provider so HTTP connections (and TLS sessions) are reused across calls.
+    """
     if llm_provider.lower() == "openai":
         api_key = os.getenv("OPENAI_API_KEY")
         if not api_key:
             raise ValueError("OPENAI_API_KEY not found in environment variables.")
-        return OpenAI(api_key=api_key)
+        # DefaultHttpxClient keeps the SDK's defaults (e.g. follow_redirects) alongside the limits
+        http_client = DefaultHttpxClient(limits=LLM_CONNECTION_LIMITS)
+        return OpenAI(api_key=api_key, http_client=http_client, max_retries=LLM_MAX_RETRIES, timeout=LLM_TIMEOUT)
     # Add logic for other LLM providers here if needed
     # elif llm_provider.lower() == "other_llm":
     #     api_key = os.getenv("OTHER_LLM_API_KEY")
@@ -72,98 +309,187 @@ def get_llm_client(llm_provider: str = "openai"):
     else:
         raise ValueError(f"Unsupported LLM provider: {llm_provider}")
 
+@functools.lru_cache(maxsize=4)
+def get_async_llm_client(llm_provider: str = "openai"):
+    """Initializes and returns the appropriate asyncio LLM client, cached per provider."""
+    if llm_provider.lower() == "openai":
+        api_key = os.getenv("OPENAI_API_KEY")
+        if not api_key:
+            raise ValueError("OPENAI_API_KEY not found in environment variables.")
+        http_client = DefaultAsyncHttpxClient(limits=LLM_CONNECTION_LIMITS)
+        return AsyncOpenAI(api_key=api_key, http_client=http_client, max_retries=LLM_MAX_RETRIES, timeout=LLM_TIMEOUT)
+    else:
+        raise ValueError(f"Unsupported LLM provider: {llm_provider}")
+
+def _build_messages(document_text: str, model: str) -> List[dict]:
+    """Builds the chat messages for an extraction request."""
+    # Only the document varies between calls, so it goes last to keep the cached prefix stable
+    prompt = f"""Document Text:
+```
+{document_text}
+```"""
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "system", "content": get_extraction_instructions(model)},
+        {"role": "user", "content": prompt}
+    ]
+
+def _reprompt_messages(messages: List[dict], raw_json_output: Optional[str], error: ValidationError) -> List[dict]:
+    """Appends the rejected answer and a stricter instruction for a validation retry."""
+    return messages + [
+        {"role": "assistant", "content": raw_json_output or ""},
+        {"role": "user", "content": (
+            f"That response was not valid: {error.errors(include_url=False, include_input=False)[:3]}. "
+            "Return ONLY a single JSON object with the exact keys specified, using strings, lists of strings or null as values."
+        )}
+    ]
+
+def _completion_kwargs(model: str, messages: List[dict]) -> dict:
+    """Returns the arguments for a streamed chat completion request."""
+    return dict(
+        model=model,
+        messages=messages,
+        response_format={"type": "json_object"}, # Request JSON output if supported
+        temperature=0.2, # Lower temperature for more deterministic output
+        stream=True, # Receive tokens while the model is still generating
+        stream_options={"include_usage": True} # Usage arrives in the final chunk
+    )
+
+def _stream_completion(client, model: str, messages: List[dict]):
+    """Runs a streamed chat completion and returns the full content and the usage data."""
+    parts = []
+    usage = None
+    for chunk in client.chat.completions.create(**_completion_kwargs(model, messages)):
+        if chunk.choices:
+            parts.append(chunk.choices[0].delta.content or "")
+        if chunk.usage:
+            usage = chunk.usage
+    return "".join(parts), usage
+
+async def _stream_completion_async(client, model: str, messages: List[dict]):
+    """Async counterpart of _stream_completion."""
+    parts = []
+    usage = None
+    async for chunk in await client.chat.completions.create(**_completion_kwargs(model, messages)):
+        if chunk.choices:
+            parts.append(chunk.choices[0].delta.content or "")
+        if chunk.usage:
+            usage = chunk.usage
+    return "".join(parts), usage
+
+def _record_cost(model: str, usage) -> None:
+    """Adds the cost of one API call to the running total and logs it."""
+    if not usage:
+        logging.warning("Could not calculate cost: Usage data missing or unsupported provider.")
+        return
+    prompt_tokens = usage.prompt_tokens
+    completion_tokens = usage.completion_tokens
+    details = getattr(usage, 'prompt_tokens_details', None)
+    cached_tokens = getattr(details, 'cached_tokens', 0) or 0
+    call_cost = _calculate_cost(model, prompt_tokens, completion_tokens, cached_tokens)
+    total_cost = _add_cost(call_cost)
+    logging.info(f"API Call Cost ({model}): ${call_cost:.6f} (Prompt: {prompt_tokens}, Cached: {cached_tokens}, Completion: {completion_tokens})")
+    logging.info(f"Accumulated Cost: ${total_cost:.6f}")
+
+def _parse_output(raw_json_output: str) -> InsuranceData:
+    """Validates the raw LLM output, raising ValidationError if it is empty, malformed or off-schema."""
+    # JSON mode never wraps output in markdown, but other models may; keep only the outermost object
+    match = _JSON_OBJECT_RE.search(raw_json_output)
+    cleaned_json_output = match.group(0) if match else raw_json_output
+    # Parse and validate the JSON in a single pass (pydantic-core)
+    return InsuranceData.model_validate_json(cleaned_json_output)
+
+def _store_in_cache(key: Optional[str], validated_data: InsuranceData) -> None:
+    """Stores a validated result in the response cache, if caching is enabled for the call."""
+    if key is None:
+        return
+    try:
+        # Stored by alias, since model_validate_json only accepts the aliased keys
+        get_cache().set(key, validated_data.model_dump_json(by_alias=True))
+    except Exception as e:
+        logging.warning(f"Failed to store result in response cache: {e}")
+
 def extract_structured_data(
     document_text: str,
     llm_provider: str = "openai",
     model: str = "gpt-3.5-turbo", # Or another suitable model
-    max_retries: int = 2,
-    retry_delay: int = 5 # seconds
+    validation_retries: int = 1,
+    use_cache: bool = True
 ) -> Optional[InsuranceData]:
-    """Sends document text to the LLM and attempts to extract structured data."""
+    """Sends document text to the LLM and attempts to extract structured data.
 
-    prompt = f"""Extract the following information from this insurance document:
-    1. Policyholder Name
-    2. Policy Number
-    3. Start Date
-    4. End Date
-    5. Coverage Types (list of strings)
-    6. Risk Factors (list of strings)
+    API errors are retried by the client itself; a response that fails validation is
+    re-prompted up to validation_retries times.
+    """
+    client = get_llm_client(llm_provider)
 
-    Return the information ONLY in JSON format with the exact keys specified above (e.g., "Policyholder Name"). If a field is not found, omit it or set its value to null.
+    cache_key = None
+    if use_cache:
+        cache_key, cached = _lookup_cache(document_text, model)
+        if cached:
+            return cached
 
-    Document Text:
-    ```
-    {document_text}
-    ```
+    messages = _build_messages(document_text, model)
+    for attempt in range(validation_retries + 1):
+        try:
+            raw_json_output, usage = _stream_completion(client, model, messages)
+        except Exception as e:
+            logging.error(f"An unexpected error occurred: {e}", exc_info=True)
+            return None
+        _record_cost(model, usage)
+        try:
+            validated_data = _parse_output(raw_json_output)
+        except ValidationError as e:
+            # Covers empty output, malformed JSON and schema mismatches
+            logging.error(f"Attempt {attempt + 1}: Validation error: {e}")
+            logging.debug(f"Raw response: {raw_json_output}") # Log raw response only at debug level
+            messages = _reprompt_messages(messages, raw_json_output, e)
+            continue
+        logging.info("Successfully extracted and validated data.")
+        _store_in_cache(cache_key, validated_data)
+        return validated_data
+
+    logging.error("Failed to extract structured data after multiple retries.")
+    return None
+
+async def extract_structured_data_async(
+    document_text: str,
+    llm_provider: str = "openai",
+    model: str = "gpt-3.5-turbo",
+    validation_retries: int = 1,
+    use_cache: bool = True
+) -> Optional[InsuranceData]:
+    """Async version of extract_structured_data for use inside an event loop.
 
-    JSON Output:
+    The LLM call is awaited directly; only the sqlite cache access runs in a thread.
     """
+    client = get_async_llm_client(llm_provider)
 
-    client = get_llm_client(llm_provider)
-    attempt = 0
+    cache_key = None
+    if use_cache:
+        cache_key, cached = await asyncio.to_thread(_lookup_cache, document_text, model)
+        if cached:
+            return cached
 
-    while attempt < max_retries:
+    messages = _build_messages(document_text, model)
+    for attempt in range(validation_retries + 1):
         try:
-            if llm_provider.lower() == "openai":
-                response = client.chat.completions.create(
-                    model=model,
-                    messages=[
-                        {"role": "system", "content": "You are an expert assistant specialized in extracting structured data from insurance documents into JSON format."},
-                        {"role": "user", "content": prompt}
-                    ],
-                    response_format={"type": "json_object"}, # Request JSON output if supported
-                    temperature=0.2 # Lower temperature for more deterministic output
-                )
-                raw_json_output = response.choices[0].message.content
-            # Add logic for other LLMs here
-            # elif llm_provider.lower() == "other_llm":
-            #     # ... call other LLM API ...
-            #     raw_json_output = ...
-            else:
-                 return None # Should not happen if get_llm_client worked
-
-            if not raw_json_output:
-                print(f"Attempt {attempt + 1}: LLM returned empty response.")
-                raise ValueError("Empty response from LLM")
-
-            # Basic cleaning in case the LLM includes markdown backticks
-            cleaned_json_output = raw_json_output.strip().strip('```json').strip('```').strip()
-
-            # Parse the JSON string
-            data = json.loads(cleaned_json_output)
-
-            # Validate with Pydantic
-            validated_data = InsuranceData.parse_obj(data)
-            logging.info("Successfully extracted and validated data.")
-
-            # --- Cost Calculation ---
-            global _total_cost
-            if llm_provider.lower() == "openai" and hasattr(response, 'usage') and response.usage:
-                prompt_tokens = response.usage.prompt_tokens
-                completion_tokens = response.usage.completion_tokens
-                call_cost = _calculate_cost(model, prompt_tokens, completion_tokens)
-                _total_cost += call_cost
-                logging.info(f"API Call Cost ({model}): ${call_cost:.6f} (Prompt: {prompt_tokens}, Completion: {completion_tokens})")
-                logging.info(f"Accumulated Cost: ${_total_cost:.6f}")
-            else:
-                logging.warning("Could not calculate cost: Usage data missing or unsupported provider.")
-            # --- End Cost Calculation ---
-
-            return validated_data
-
-        except json.JSONDecodeError as e:
-            logging.error(f"Attempt {attempt + 1}: Failed to decode JSON from LLM response: {e}")
-            logging.debug(f"Raw response: {raw_json_output}") # Log raw response only at debug level
+            raw_json_output, usage = await _stream_completion_async(client, model, messages)
+        except Exception as e:
+            logging.error(f"An unexpected error occurred: {e}", exc_info=True)
+            return None
+        _record_cost(model, usage)
+        try:
+            validated_data = _parse_output(raw_json_output)
         except ValidationError as e:
+            # Covers empty output, malformed JSON and schema mismatches
             logging.error(f"Attempt {attempt + 1}: Validation error: {e}")
-            logging.debug(f"Parsed data: {data}") # Log parsed data only at debug level
-        except Exception as e:
-            logging.error(f"Attempt {attempt + 1}: An unexpected error occurred: {e}", exc_info=True)
-
-        attempt += 1
-        if attempt < max_retries:
-            logging.warning(f"Retrying in {retry_delay} seconds...")
-            time.sleep(retry_delay)
+            logging.debug(f"Raw response: {raw_json_output}") # Log raw response only at debug level
+            messages = _reprompt_messages(messages, raw_json_output, e)
+            continue
+        logging.info("Successfully extracted and validated data.")
+        await asyncio.to_thread(_store_in_cache, cache_key, validated_data)
+        return validated_data
 
     logging.error("Failed to extract structured data after multiple retries.")
     return None
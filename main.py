@@ -1,10 +1,11 @@
 import os
+import asyncio
 import argparse
-import json
+import orjson
 import logging
 from typing import Optional
-from document_processor import process_document
-from llm_service import extract_structured_data, InsuranceData, get_total_cost, reset_cost # Import cost functions
+from document_processor import process_document, MAX_CHAR_LIMIT
+from llm_service import extract_structured_data, InsuranceData, get_total_cost, reset_cost, get_max_document_chars, truncate_to_token_limit # Import cost functions
 
 # --- Setup Logging ---
 logging.basicConfig(level=logging.INFO, 
@@ -15,16 +16,66 @@ logging.basicConfig(level=logging.INFO,
                     ])
 
 # --- Argument Parsing ---
+def positive_int(value: str) -> int:
+    """argparse type for options that must be at least 1."""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return number
+
 def parse_arguments():
     parser = argparse.ArgumentParser(description='Extract structured data from insurance documents.')
     parser.add_argument('input_path', type=str, help='Path to an input document (PDF/TXT) or a directory containing documents.')
     parser.add_argument('-o', '--output_dir', type=str, default='output', help='Directory to save the structured JSON output.')
     parser.add_argument('--llm', type=str, default='openai', help='LLM provider to use (e.g., openai).')
     parser.add_argument('--model', type=str, default='gpt-3.5-turbo', help='Specific LLM model to use.')
+    parser.add_argument('--concurrency', type=positive_int, default=8, help='Maximum number of documents processed at the same time.')
+    parser.add_argument('--no-cache', action='store_true', help='Always call the LLM instead of reusing cached results for identical documents.')
     return parser.parse_args()
 
 # --- Main Pipeline ---
-def main():
+async def process_one(file_path: str, sem: asyncio.Semaphore, output_dir: str, llm_provider: str, model: str, use_cache: bool = True):
+    """Reads, extracts and saves the structured data for a single document."""
+    async with sem:
+        logging.info(f"--- Processing file: {os.path.basename(file_path)} ---")
+
+        # 1. Process Document
+        # Read only as much as the model's token budget can use; tiktoken makes the exact cut below
+        max_chars = await asyncio.to_thread(get_max_document_chars, model, MAX_CHAR_LIMIT)
+        document_text = await asyncio.to_thread(process_document, file_path, max_chars)
+        if not document_text:
+            logging.error(f"Failed to read or process document: {file_path}")
+            return
+        logging.info(f"Successfully read and cleaned document: {os.path.basename(file_path)}")
+        document_text = await asyncio.to_thread(truncate_to_token_limit, document_text, model, MAX_CHAR_LIMIT)
+
+        # 2. Extract Data using LLM
+        logging.info(f"Sending document to LLM ({llm_provider} - {model})...")
+        structured_data: Optional[InsuranceData] = await asyncio.to_thread(
+            extract_structured_data,
+            document_text,
+            llm_provider=llm_provider,
+            model=model,
+            use_cache=use_cache
+        )
+
+        # 3. Save Output
+        if structured_data:
+            output_filename = os.path.splitext(os.path.basename(file_path))[0] + '.json'
+            output_filepath = os.path.join(output_dir, output_filename)
+            try:
+                with open(output_filepath, 'wb') as f:
+                    # Use by_alias=True to get the original field names in JSON
+                    f.write(orjson.dumps(structured_data.model_dump(by_alias=True), option=orjson.OPT_INDENT_2))
+                logging.info(f"Successfully extracted data and saved to: {output_filepath}")
+            except Exception as e:
+                logging.error(f"Failed to save output JSON for {file_path}: {e}")
+        else:
+            logging.error(f"Failed to extract structured data for: {file_path}")
+
+        logging.info(f"--- Finished processing file: {os.path.basename(file_path)} ---")
+
+async def main():
     reset_cost() # Reset cost at the beginning of the run
     args = parse_arguments()
 
@@ -60,42 +111,13 @@ def main():
 
     logging.info(f"Found {len(files_to_process)} documents to process.")
 
-    for file_path in files_to_process:
-        logging.info(f"--- Processing file: {os.path.basename(file_path)} ---")
-        
-        # 1. Process Document
-        document_text = process_document(file_path)
-        if not document_text:
-            logging.error(f"Failed to read or process document: {file_path}")
-            continue
-        logging.info(f"Successfully read and cleaned document: {os.path.basename(file_path)}")
-
-        # 2. Extract Data using LLM
-        logging.info(f"Sending document to LLM ({llm_provider} - {model})...")
-        structured_data: Optional[InsuranceData] = extract_structured_data(
-            document_text,
-            llm_provider=llm_provider,
-            model=model
-        )
-
-        # 3. Save Output
-        if structured_data:
-            output_filename = os.path.splitext(os.path.basename(file_path))[0] + '.json'
-            output_filepath = os.path.join(output_dir, output_filename)
-            try:
-                with open(output_filepath, 'w', encoding='utf-8') as f:
-                    # Use by_alias=True to get the original field names in JSON
-                    json.dump(structured_data.dict(by_alias=True), f, indent=4)
-                logging.info(f"Successfully extracted data and saved to: {output_filepath}")
-            except Exception as e:
-                logging.error(f"Failed to save output JSON for {file_path}: {e}")
-        else:
-            logging.error(f"Failed to extract structured data for: {file_path}")
-        
-        logging.info(f"--- Finished processing file: {os.path.basename(file_path)} ---")
+    # Documents are processed concurrently; the semaphore bounds in-flight LLM calls
+    sem = asyncio.Semaphore(args.concurrency)
+    tasks = [process_one(file_path, sem, output_dir, llm_provider, model, use_cache=not args.no_cache) for file_path in files_to_process]
+    await asyncio.gather(*tasks)
 
     total_cost = get_total_cost()
     logging.info(f"Pipeline finished. Total estimated cost for this run: ${total_cost:.6f}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,117 @@
+import io
+import queue
+
+import pytest
+from fastapi.testclient import TestClient
+
+import api
+from llm_service import InsuranceData
+
+
+class ReadOnlyStream:
+    """File object without readinto, like SpooledTemporaryFile before Python 3.11."""
+
+    def __init__(self, data):
+        self._stream = io.BytesIO(data)
+
+    def read(self, size=-1):
+        return self._stream.read(size)
+
+
+@pytest.fixture
+def empty_pool(monkeypatch):
+    pool = queue.LifoQueue(maxsize=api.UPLOAD_BUFFER_POOL_SIZE)
+    monkeypatch.setattr(api, "_upload_buffers", pool)
+    return pool
+
+
+def test_upload_of_exactly_limit_bytes_stays_in_memory():
+    data = bytes(range(10))
+    stream = io.BytesIO(data)
+
+    buffer, size = api._read_into_buffer(stream, bytearray(4), limit=10)
+
+    assert size == 10
+    assert bytes(buffer[:size]) == data
+    assert stream.read() == b""
+
+
+def test_upload_over_limit_stops_reading_and_leaves_the_rest_in_the_stream():
+    data = bytes(range(20))
+    stream = io.BytesIO(data)
+
+    buffer, size = api._read_into_buffer(stream, bytearray(4), limit=10)
+
+    assert size == 11
+    assert bytes(buffer[:size]) + stream.read() == data
+
+
+def test_stream_without_readinto_is_read_in_full():
+    data = b"%PDF-1.7 policy"
+
+    buffer, size = api._read_into_buffer(ReadOnlyStream(data), bytearray(4), limit=100)
+
+    assert bytes(buffer[:size]) == data
+
+
+def test_readinto_fallback_fills_the_view():
+    target = bytearray(8)
+
+    with memoryview(target) as view:
+        n = api._readinto(ReadOnlyStream(b"abc"), view)
+
+    assert n == 3
+    assert target[:3] == b"abc"
+
+
+def test_grown_buffer_is_not_returned_to_the_pool(empty_pool):
+    api._return_buffer(bytearray(api.UPLOAD_BUFFER_SIZE + 1))
+    assert empty_pool.empty()
+
+    api._return_buffer(bytearray(api.UPLOAD_BUFFER_SIZE))
+    assert empty_pool.qsize() == 1
+
+
+def test_upload_over_memory_limit_is_spilled_in_full(monkeypatch):
+    data = b"x" * 100
+    seen = {}
+
+    def read_and_clean_pdf(data_or_path, max_chars=None, filetype="pdf"):
+        with open(data_or_path, "rb") as f:
+            seen["data"] = f.read()
+        return "Policyholder: Ann"
+
+    async def extract_structured_data_async(text, **kwargs):
+        return InsuranceData.model_validate({"Policyholder Name": "Ann"})
+
+    monkeypatch.setattr(api, "MAX_IN_MEMORY_UPLOAD_BYTES", 10)
+    monkeypatch.setattr(api, "read_and_clean_pdf", read_and_clean_pdf)
+    monkeypatch.setattr(api, "get_max_document_chars", lambda model, fallback_max_chars: fallback_max_chars)
+    monkeypatch.setattr(api, "truncate_to_token_limit", lambda text, model, fallback_max_chars: text)
+    monkeypatch.setattr(api, "get_async_llm_client", lambda llm_provider="openai": object())
+    monkeypatch.setattr(api, "extract_structured_data_async", extract_structured_data_async)
+
+    with TestClient(api.app) as client:
+        response = client.post("/upload/?save=false", files={"file": ("policy.pdf", data, "application/pdf")})
+
+    assert response.status_code == 200
+    assert response.json()["extracted_data"]["policyholder_name"] == "Ann"
+    assert seen["data"] == data
+
+
+def test_frontend_is_served_with_an_etag():
+    with TestClient(api.app) as client:
+        response = client.get("/")
+        revalidated = client.get("/", headers={"If-None-Match": response.headers["etag"]})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/html")
+    assert revalidated.status_code == 304
+
+
+def test_upload_without_trailing_slash_is_redirected():
+    with TestClient(api.app) as client:
+        response = client.post("/upload", follow_redirects=False)
+
+    assert response.status_code == 307
+    assert response.headers["location"].endswith("/upload/")
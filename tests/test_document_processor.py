@@ -0,0 +1,32 @@
+from document_processor import _clean_and_truncate, clean_text, process_document
+
+
+def test_stops_consuming_pages_once_the_budget_is_reached():
+    consumed = []
+
+    def pages():
+        for text in ["a" * 6, "b" * 6, "c" * 6]:
+            consumed.append(text)
+            yield text
+
+    assert _clean_and_truncate(pages(), max_chars=10) == "aaaaaa bbb"
+    assert len(consumed) == 2
+
+
+def test_empty_pages_are_skipped():
+    assert _clean_and_truncate(iter(["one", "", "  \n ", "two"]), max_chars=None) == "one two"
+
+
+def test_result_matches_cleaning_then_slicing():
+    pages = ["  Policy  holder:\nAnn ", "", "Policy number\tP-1  ", "Cover: Fire, Theft"]
+    expected = clean_text(" ".join(pages))
+
+    for max_chars in range(len(expected) + 2):
+        assert _clean_and_truncate(iter(pages), max_chars) == expected[:max_chars].strip()
+
+
+def test_text_documents_are_truncated(tmp_path):
+    path = tmp_path / "policy.txt"
+    path.write_text("Policyholder:   Ann\n" * 100, encoding="utf-8")
+
+    assert process_document(str(path), max_chars=25) == "Policyholder: Ann Policyh"
@@ -0,0 +1,159 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import llm_service
+from llm_service import InsuranceData, ResponseCache, extract_structured_data, extract_structured_data_async
+
+LLM_OUTPUT = '{"Policyholder Name": "Ann", "Policy Number": "P-1", "Coverage Types": ["Fire"]}'
+
+
+def _chunks(content):
+    usage = SimpleNamespace(prompt_tokens=10, completion_tokens=5, prompt_tokens_details=None)
+    return [
+        SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content))], usage=None),
+        SimpleNamespace(choices=[], usage=usage),
+    ]
+
+
+class FakeClient:
+    """Minimal stand-in for the OpenAI client that streams queued answers (the last one repeats)."""
+
+    def __init__(self, *outputs):
+        self.outputs = list(outputs) or [LLM_OUTPUT]
+        self.completion_calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._complete))
+
+    def _next_output(self):
+        self.completion_calls += 1
+        return self.outputs.pop(0) if len(self.outputs) > 1 else self.outputs[0]
+
+    def _complete(self, **kwargs):
+        return _chunks(self._next_output())
+
+
+class FakeAsyncClient(FakeClient):
+    """Async variant of FakeClient, mirroring AsyncOpenAI's awaitable streaming API."""
+
+    async def _complete(self, **kwargs):
+        async def stream():
+            for chunk in _chunks(self._next_output()):
+                yield chunk
+        return stream()
+
+
+@pytest.fixture(autouse=True)
+def isolated_cache(monkeypatch, tmp_path):
+    monkeypatch.setattr(llm_service, "_cache", ResponseCache(path=tmp_path / "cache.sqlite"))
+
+
+@pytest.fixture
+def fake_client(monkeypatch):
+    client = FakeClient()
+    monkeypatch.setattr(llm_service, "get_llm_client", lambda llm_provider="openai": client)
+    return client
+
+
+@pytest.fixture
+def fake_async_client(monkeypatch):
+    client = FakeAsyncClient()
+    monkeypatch.setattr(llm_service, "get_async_llm_client", lambda llm_provider="openai": client)
+    return client
+
+
+def test_cache_hit_returns_the_extracted_data(fake_client):
+    first = extract_structured_data("Policyholder: Ann")
+    second = extract_structured_data("Policyholder:   Ann\n")
+
+    assert fake_client.completion_calls == 1
+    assert first == InsuranceData.model_validate_json(LLM_OUTPUT)
+    assert second == first
+    assert second.policyholder_name == "Ann"
+
+
+def test_similar_documents_do_not_share_cache_entries(fake_client):
+    extract_structured_data("Policyholder: Ann\nPolicy Number: P-1")
+    extract_structured_data("Policyholder: Bob\nPolicy Number: P-2")
+
+    assert fake_client.completion_calls == 2
+
+
+def test_prompt_change_invalidates_cache(fake_client, monkeypatch):
+    extract_structured_data("Policyholder: Ann")
+    monkeypatch.setattr(llm_service, "EXTRACTION_INSTRUCTIONS", llm_service.EXTRACTION_INSTRUCTIONS + "Be brief.\n")
+    llm_service._prompt_fingerprint.cache_clear()
+    try:
+        extract_structured_data("Policyholder: Ann")
+    finally:
+        llm_service._prompt_fingerprint.cache_clear()
+
+    assert fake_client.completion_calls == 2
+
+
+def test_cache_can_be_disabled(fake_client):
+    extract_structured_data("Policyholder: Ann", use_cache=False)
+    extract_structured_data("Policyholder: Ann", use_cache=False)
+
+    assert fake_client.completion_calls == 2
+
+
+def test_invalid_response_is_reprompted_once(fake_client):
+    fake_client.outputs = ["not json", LLM_OUTPUT]
+
+    result = extract_structured_data("Policyholder: Ann")
+
+    assert fake_client.completion_calls == 2
+    assert result.policyholder_name == "Ann"
+
+
+def test_gives_up_after_validation_retries(fake_client):
+    fake_client.outputs = ['{"Policy Number": 12}']
+
+    assert extract_structured_data("Policyholder: Ann") is None
+    assert fake_client.completion_calls == 2
+
+
+def test_async_extraction_shares_cache_and_retries(fake_async_client):
+    fake_async_client.outputs = ["not json", LLM_OUTPUT]
+
+    first = asyncio.run(extract_structured_data_async("Policyholder: Ann"))
+    second = asyncio.run(extract_structured_data_async("Policyholder: Ann"))
+
+    assert fake_async_client.completion_calls == 2
+    assert first.policyholder_name == "Ann"
+    assert second == first
+
+
+def test_schema_is_only_added_for_prompt_caching_models():
+    assert llm_service.get_extraction_instructions("gpt-3.5-turbo") == llm_service.EXTRACTION_INSTRUCTIONS
+    assert "JSON schema" in llm_service.get_extraction_instructions("gpt-4o-2024-08-06")
+
+
+def test_cached_prompt_tokens_are_billed_at_the_cached_rate():
+    full = llm_service._calculate_cost("gpt-4o-2024-08-06", 2000, 0)
+    cached = llm_service._calculate_cost("gpt-4o-2024-08-06", 2000, 0, cached_tokens=1024)
+
+    assert cached == pytest.approx(full - 1.024 * 0.005)
+    assert llm_service._calculate_cost("gpt-4", 2000, 0, cached_tokens=1024) == llm_service._calculate_cost("gpt-4", 2000, 0)
+
+
+def test_truncation_falls_back_to_characters_without_tokenizer(monkeypatch):
+    def fail(*args, **kwargs):
+        raise ConnectionError("no network")
+
+    llm_service._get_encoding.cache_clear()
+    monkeypatch.setattr(llm_service.tiktoken, "encoding_for_model", fail)
+    monkeypatch.setattr(llm_service.tiktoken, "get_encoding", fail)
+    try:
+        assert llm_service.truncate_to_token_limit("x" * 50, "gpt-4", fallback_max_chars=10) == "x" * 10
+        assert llm_service.get_max_document_chars("gpt-4", fallback_max_chars=10) == 10
+    finally:
+        llm_service._get_encoding.cache_clear()
+
+
+def test_character_bound_is_derived_from_the_token_budget(monkeypatch):
+    monkeypatch.setattr(llm_service, "_get_encoding", lambda model: object())
+    monkeypatch.setattr(llm_service, "get_max_document_tokens", lambda model: 12000)
+
+    assert llm_service.get_max_document_chars("gpt-4o-2024-08-06", fallback_max_chars=20000) == 12000 * llm_service.MAX_CHARS_PER_TOKEN